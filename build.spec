@@ -21,8 +21,8 @@ a = Analysis(
         'mediapipe.python.solutions.face_mesh',
         'mediapipe.tasks.python.vision.face_detector',
         'pythoncom', 'win32timezone', 'pywintypes',
-        'yaml', 'julep', 'dotenv', 'pyttsx3', 'pyperclip',
-        'win32gui', 'win32con'  # New dependencies added
+        'julep', 'dotenv', 'pyttsx3', 'pyperclip', 'orjson',
+        'win32gui', 'win32con', 'win32clipboard'  # New dependencies added
     ],
     hookspath=[],
     hooksconfig={},
@@ -1,23 +1,103 @@
-import json
+import orjson
 import keyboard as kb
 import pyautogui
 import subprocess
+import shlex
+import shutil
 import webbrowser
 import time
-import yaml
 from julep import Julep
 from window_utils import get_active_window
+from command_templates import match_template, generalize_commands, fill_template
 import os
+import hashlib
+import tempfile
+import winsound
 import pyttsx3 
 import pyperclip
+import win32clipboard
+import pywintypes
 import threading
+import asyncio
+import ctypes
 import re
+from collections import OrderedDict, deque
 from dotenv import load_dotenv
 
-load_dotenv()
+# Finds a JSON array of command objects inside an unstructured Julep output
+_JSON_ARRAY_RE = re.compile(r'\[\s*\{.*\}\s*\]', re.DOTALL)
+# Markdown code fences the model sometimes wraps around its JSON
+_CODE_FENCE_RE = re.compile(r'```(?:json)?')
+
+def _from_list(output):
+    """Content of the first assistant message in a list of messages"""
+    for item in output:
+        if isinstance(item, dict):
+            if item.get('role') == 'assistant':
+                return item.get('content', '')
+        elif getattr(item, 'role', None) == 'assistant' and hasattr(item, 'content'):
+            return item.content
+    return ""
+
+
+def _from_dict(output):
+    """Content of a chat completion ({'choices': [{'message': ...}]}) or a plain message dict"""
+    choice = (output.get('choices') or [{}])[0]
+    return (choice.get('message') or {}).get('content') or choice.get('content') or output.get('content', '')
+
+
+def _from_str(output):
+    return output
+
+
+def _from_other(output):
+    """Unknown shapes fall through to the regex search over str(output)"""
+    return ""
+
+
+# Response text extractors keyed by the type of a Julep execution output
+_EXTRACTORS = {list: _from_list, dict: _from_dict, str: _from_str}
+
+# Julep execution polling: exponential backoff capped at POLL_MAX_DELAY, 15 seconds max wait
+POLL_INITIAL_DELAY = 0.025
+POLL_BACKOFF = 1.6
+POLL_MAX_DELAY = 0.5
+POLL_TIMEOUT = 15
+
+# Julep agent settings and the on-disk cache of the ids created from them
+AGENT_CONFIG = {
+    "name": "VoiceControl",
+    "model": "gpt-4o-mini",
+    "about": "System control assistant that outputs valid JSON commands"
+}
+JULEP_IDS_PATH = os.path.join(os.path.expanduser("~"), ".hands_free", "julep_ids.json")
+
+# Attempts at opening a clipboard locked by another process, 50ms apart
+CLIPBOARD_OPEN_RETRIES = 10
+
+# Synthesized speech cache for short recurring phrases
+TTS_CACHE_SIZE = 32
+TTS_CACHE_MAX_BYTES = 2 * 1024 * 1024
+TTS_CACHEABLE_CHARS = 200
+TTS_SEEN_SIZE = 256
+
+# Fire-and-forget commands that need no keyboard/mouse focus. VoiceAssistant
+# launches consecutive ones back to back and waits for windows/pages once.
+BACKGROUND_COMMANDS = frozenset({'run_command', 'open_url', 'llm_response'})
+
+# Commands containing these need cmd.exe to interpret them
+SHELL_METACHARS = frozenset('&|<>^%')
+
+# Upper bound on cached command templates (LRU)
+TEMPLATE_CACHE_SIZE = 128
+
 
 class CommandHandler:
-    PROMPT_TEMPLATE = """
+    # Static part of the prompt. It is rendered once per handler and sent as
+    # the system message so the provider can reuse it as a cached prefix.
+    STATIC_SYSTEM_PROMPT = """
+        You are a system control agent. Return a JSON array of commands only.
+
         Analyze requests through this decision framework:
 
         1. Request Type Detection:
@@ -31,7 +111,7 @@ class CommandHandler:
         - For Store apps: 'start shell:appsFolder\PackageName!App'
         - Complex paths: 'start "" "C:/Path/To App.exe"'
         - System handles window waiting automatically (no long sleeps needed)
-        b. Window Context: Use shortcuts specific to {window_title}
+        b. Window Context: Use shortcuts specific to the Current Window
         c. Multi-step Sequencing: Break complex tasks into ordered steps
         - Group related commands without sleeps between them
         d. Error Prevention: 
@@ -51,6 +131,7 @@ class CommandHandler:
         - Information: llm_response (verbal) OR type_text (direct input)
         - Flow Control: Minimal 0.1-0.3s sleeps between input actions
         - Speech Control: speak_text, stop_speaking, read_from_cursor
+        (reads to document end; mode 'progressive' reads paragraph by paragraph)
             
         4. Key Press Optimization:
         - Press multiple keys simultaneously via press_keys
@@ -60,7 +141,6 @@ class CommandHandler:
         5.abrogate is for stop listening
         
         Available Commands: {commands}
-        Current Window: {window_title}
 
         Examples:
         1. "Quick app launch sequence"
@@ -118,10 +198,19 @@ class CommandHandler:
         - Fallback sequence: Win+R → Type name → Enter
         - Prefer key combos over mouse movements
         - Verify admin rights when needed
+    """
 
+    # Per-request part of the prompt, sent as the user message
+    DYNAMIC_TAIL = """
+        Previous conversation context:
+        {context}
+
+        Current Window: {window_title}
         Request: {text}
         Respond ONLY with a valid JSON array:
     """
+    # DYNAMIC_TAIL split around its context, window_title and text placeholders
+    _TAIL_PARTS = tuple(re.split(r"\{(?:context|window_title|text)\}", DYNAMIC_TAIL))
 
     def __init__(self, assistant=None, julep_api_key=None):
         self.assistant = assistant
@@ -143,6 +232,10 @@ class CommandHandler:
             'hold_mouse': self.hold_mouse,
             'release_mouse': self.release_mouse,
         }
+        # Command names never change after this point, so render the static prompt once
+        self._static_prompt = self.STATIC_SYSTEM_PROMPT.format(commands=list(self.actions.keys()))
+        # Screen resolution does not change during a session
+        self._screen_w, self._screen_h = pyautogui.size()
         
         # Text-to-speech engine setup
         try:
@@ -150,62 +243,43 @@ class CommandHandler:
             self.engine.setProperty('rate', 150)
             self.engine.setProperty('volume', 0.9)
         except Exception as e:
-            if self.assistant:
-                self.assistant.log(f"TTS Error: {str(e)}")
+            self.log(f"TTS Error: {str(e)}")
             self.engine = None
             
         self.is_speaking = False
         self.speech_thread = None
-        self.speech_lock = threading.Lock()
+        # Reentrant: speak_text calls stop_speaking while holding the lock
+        self.speech_lock = threading.RLock()
+        self.stop_failures = 0
+        # Synthesized WAV bytes of short phrases, keyed by text digest (LRU)
+        self._tts_cache = OrderedDict()
+        self._tts_cache_bytes = 0
+        # Digests of recently spoken phrases; a phrase is cached on its second use
+        self._tts_seen = OrderedDict()
         
-        # Initialize Julep client
-        api_key = os.getenv('JULEP_API_KEY')
-        if not api_key:
-            raise ValueError("JULEP_API_KEY environment variable is not set")
-            
-        self.client = Julep(api_key=api_key)
+        # Julep client, agent and task are set up on the first command generation
+        self.julep_api_key = julep_api_key
+        self._client = None
+        self.task_id = None
         
-        # Create or reuse the agent
-        try:
-            self.agent = self.client.agents.create(
-                name="VoiceControl",
-                model="gpt-4o-mini",
-                about="System control assistant that outputs valid JSON commands"
-            )
-        except Exception as e:
-            if self.assistant:
-                self.assistant.log(f"Agent creation failed: {str(e)}")
-            raise
-            
-        # Create the task template
-        try:
-            self.task = self.client.tasks.create(
-                agent_id=self.agent.id,
-                name="Voice Command Handler",
-                description="Interpret user voice command and return system-level actions in JSON",
-                main=yaml.safe_load("""
-                    - prompt:
-                      - role: system
-                        content: You are a system control agent. Return a JSON array of commands only.
-                      - role: user
-                        content: $ f\"\"\"{steps[0].input.prompt}\"\"\"
-                """)
-            )
-        except Exception as e:
-            if self.assistant:
-                self.assistant.log(f"Task creation failed: {str(e)}")
-            raise
-        
-        # Add conversation history
-        self.conversation_history = []
+        # Add conversation history as (user, assistant) pairs, last 3 exchanges only
+        self.conversation_history = deque(maxlen=3)
+        # Generalized single-command plans keyed by request template (LRU)
+        self._template_cache = OrderedDict()
+        # Last uncached template per request template, awaiting a second matching plan
+        self._template_candidates = {}
+
+    def log(self, message):
+        """Log through the assistant, if there is one"""
+        if self.assistant:
+            self.assistant.log(message)
 
     def open_url(self, url="", **kwargs):
         """Wrapper for webbrowser.open with error handling"""
         try:
             webbrowser.open(url)
         except Exception as e:
-            if self.assistant:
-                self.assistant.log(f"Failed to open URL: {str(e)}")
+            self.log(f"Failed to open URL: {str(e)}")
 
     def speak_text(self, text="", **kwargs):
         """Handle text-to-speech output in background thread"""
@@ -216,15 +290,32 @@ class CommandHandler:
         with self.speech_lock:
             if self.is_speaking:
                 self.stop_speaking()
+            # Let the previous speech thread leave the engine loop before reusing it
+            if self.speech_thread and self.speech_thread.is_alive():
+                self.speech_thread.join(timeout=0.1)
 
             def run_speech():
                 self.is_speaking = True
                 try:
-                    self.engine.say(text)
-                    self.engine.runAndWait()
+                    key = hashlib.blake2b(text.encode(), digest_size=16).digest()
+                    wav = self._tts_cache.get(key)
+                    # Speak one-off text directly; only render phrases that have come up before
+                    if wav is None and (len(text) > TTS_CACHEABLE_CHARS or not self._seen_phrase(key)):
+                        self.engine.say(text)
+                        self.engine.runAndWait()
+                        return
+                    if wav is None:
+                        wav = self._synthesize(text)
+                        # A stop during synthesis leaves a truncated file behind
+                        if not self.is_speaking:
+                            return
+                        self._cache_speech(key, wav)
+                    else:
+                        self._tts_cache.move_to_end(key)
+                    # Already on the speech thread; SND_ASYNC is not allowed with SND_MEMORY
+                    winsound.PlaySound(wav, winsound.SND_MEMORY)
                 except Exception as e:
-                    if self.assistant:
-                        self.assistant.log(f"Speech Error: {str(e)}")
+                    self.log(f"Speech Error: {str(e)}")
                 finally:
                     self.is_speaking = False
 
@@ -232,6 +323,37 @@ class CommandHandler:
             self.speech_thread.daemon = True
             self.speech_thread.start()
         
+    def _synthesize(self, text):
+        """Render text to WAV bytes with the TTS engine"""
+        fd, path = tempfile.mkstemp(suffix='.wav')
+        os.close(fd)
+        try:
+            self.engine.save_to_file(text, path)
+            self.engine.runAndWait()
+            with open(path, 'rb') as f:
+                return f.read()
+        finally:
+            os.remove(path)
+
+    def _seen_phrase(self, key):
+        """Record a phrase digest and report whether it was already seen (LRU)"""
+        seen = key in self._tts_seen
+        self._tts_seen[key] = None
+        self._tts_seen.move_to_end(key)
+        if len(self._tts_seen) > TTS_SEEN_SIZE:
+            self._tts_seen.popitem(last=False)
+        return seen
+
+    def _cache_speech(self, key, wav):
+        """Store synthesized speech, evicting least recently used entries over the limits"""
+        if key in self._tts_cache or len(wav) > TTS_CACHE_MAX_BYTES:
+            return
+        self._tts_cache[key] = wav
+        self._tts_cache_bytes += len(wav)
+        while len(self._tts_cache) > TTS_CACHE_SIZE or self._tts_cache_bytes > TTS_CACHE_MAX_BYTES:
+            _, evicted = self._tts_cache.popitem(last=False)
+            self._tts_cache_bytes -= len(evicted)
+
     def hold_mouse(self, **kwargs):
         """Press and hold mouse button at current position"""
         button = kwargs.get('button', 'left')
@@ -242,68 +364,109 @@ class CommandHandler:
         button = kwargs.get('button', 'left')
         pyautogui.mouseUp(button=button)
 
-    def read_from_cursor(self, **kwargs):
-        """Read text from current cursor position by simulating selection"""
+    def _copy_selection(self, timeout=0.2):
+        """Copy the current selection; returns "" if the clipboard did not change"""
+        before = ctypes.windll.user32.GetClipboardSequenceNumber()
+        pyautogui.hotkey('ctrl', 'c')
+        deadline = time.monotonic() + timeout
+        while ctypes.windll.user32.GetClipboardSequenceNumber() == before:
+            if time.monotonic() >= deadline:
+                return ""  # Nothing was copied, skip reading the old clipboard
+            time.sleep(0.005)
+        return pyperclip.paste().strip()
+
+    def _save_clipboard(self):
+        """Return the clipboard text, or None if it holds something else or stays locked"""
+        # Another process may hold the clipboard briefly; retry for about 0.5s like pyperclip
+        for _ in range(CLIPBOARD_OPEN_RETRIES):
+            try:
+                win32clipboard.OpenClipboard()
+                break
+            except pywintypes.error:
+                time.sleep(0.05)
+        else:
+            return None  # Could not open it, so skip the restore
+        try:
+            if not win32clipboard.IsClipboardFormatAvailable(win32clipboard.CF_UNICODETEXT):
+                return None
+            return win32clipboard.GetClipboardData(win32clipboard.CF_UNICODETEXT)
+        finally:
+            win32clipboard.CloseClipboard()
+
+    def read_from_cursor(self, mode="single", **kwargs):
+        """Read text from current cursor position by simulating selection
+
+        mode="single" selects to the end of the document in one step,
+        mode="progressive" grows the selection paragraph by paragraph.
+        """
+        mode = kwargs.get('mode', mode)
         try:
-            original_clipboard = pyperclip.paste()
+            original_clipboard = self._save_clipboard()
             selected_text = ""
             
             # Clear existing selection and position cursor
             pyautogui.press('esc')
-            time.sleep(0.2)
+            time.sleep(0.1)
             
-            # Select from cursor position using keyboard
-            pyautogui.hotkey('shift', 'end')  # Select to line end
-            time.sleep(0.3)
-            pyautogui.hotkey('ctrl', 'c')
-            time.sleep(0.5)
-            current_text = pyperclip.paste().strip()
-            
-            if current_text:
-                # Expand selection downward
-                for _ in range(10):  # Max 10 paragraphs
-                    pyautogui.hotkey('shift', 'down')
-                    time.sleep(0.2)
-                    pyautogui.hotkey('ctrl', 'c')
-                    time.sleep(0.3)
-                    new_text = pyperclip.paste().strip()
-                    if not new_text or new_text == current_text:
-                        break
-                    current_text = new_text
+            if mode == "progressive":
+                # Select from cursor position using keyboard
+                pyautogui.hotkey('shift', 'end')  # Select to line end
+                time.sleep(0.1)
+                current_text = self._copy_selection()
+                
+                if current_text:
+                    # Expand selection downward
+                    for _ in range(10):  # Max 10 paragraphs
+                        pyautogui.hotkey('shift', 'down')
+                        time.sleep(0.1)
+                        new_text = self._copy_selection()
+                        if not new_text or new_text == current_text:
+                            break
+                        current_text = new_text
+            else:
+                # Select everything from the cursor to the end of the document
+                pyautogui.hotkey('ctrl', 'shift', 'end')
+                time.sleep(0.1)
+                current_text = self._copy_selection()
                     
-                selected_text = current_text.replace('\n', ' ')  # Clean newlines
+            selected_text = current_text.replace('\n', ' ')  # Clean newlines
 
-            # Restore original clipboard
-            pyperclip.copy(original_clipboard)
+            # Restore original clipboard; non-text content cannot be round-tripped as a string
+            if original_clipboard is not None:
+                pyperclip.copy(original_clipboard)
             
             if selected_text:
                 self.speak_text(text=selected_text)
-            elif self.assistant:
-                self.assistant.log("No text detected")
+            else:
+                self.log("No text detected")
                 
         except Exception as e:
-            if self.assistant:
-                self.assistant.log(f"Read Error: {str(e)}")
+            self.log(f"Read Error: {str(e)}")
 
     def stop_speaking(self, **kwargs):
-        """Force-stop speech with engine reset"""
+        """Stop speech, reinitializing the engine only if it is wedged"""
         with self.speech_lock:
+            # Stop playback of cached speech
+            winsound.PlaySound(None, 0)
             if self.engine:
-                # Stop current speech
-                self.engine.stop()
-                # Reset engine state
-                if hasattr(self.engine, '_driver') and self.engine._driver:
-                    self.engine._driver.stop()
-                if hasattr(self.engine, '_inLoop') and self.engine._inLoop:
-                    self.engine.endLoop()
-                # Reinitialize engine
                 try:
-                    self.engine = pyttsx3.init()
-                    self.engine.setProperty('rate', 150)
-                    self.engine.setProperty('volume', 0.9)
+                    # Stop current speech
+                    self.engine.stop()
+                    if hasattr(self.engine, '_inLoop') and self.engine._inLoop:
+                        self.engine.endLoop()
+                    self.stop_failures = 0
                 except Exception as e:
-                    if self.assistant:
-                        self.assistant.log(f"TTS Reset Error: {str(e)}")
+                    self.stop_failures += 1
+                    self.log(f"TTS Stop Error: {str(e)}")
+                # Reinitialize engine after repeated stop failures
+                if self.stop_failures >= 2:
+                    try:
+                        self.engine = pyttsx3.init()
+                        self.engine.setProperty('rate', 150)
+                        self.engine.setProperty('volume', 0.9)
+                        self.stop_failures = 0
+                    except Exception as e:
+                        self.log(f"TTS Reset Error: {str(e)}")
             
             self.is_speaking = False
             # Clean up speech thread
@@ -317,123 +480,234 @@ class CommandHandler:
     def llm_response(self, text="", **kwargs):
         """Handle verbal response through GUI"""
         if self.assistant and hasattr(self.assistant, 'gui') and self.assistant.gui and text:
-            self.assistant.gui.log(f"Assistant: {text}")
+            self.log(f"Assistant: {text}")
 
-    def generate_commands(self, text):
+    @property
+    def client(self):
+        """Julep client, created on first use"""
+        if self._client is None:
+            api_key = self.julep_api_key or os.getenv('JULEP_API_KEY')
+            if not api_key:
+                # Only read .env when the key is not already available
+                load_dotenv(override=False)
+                api_key = os.getenv('JULEP_API_KEY')
+            if not api_key:
+                raise ValueError("JULEP_API_KEY environment variable is not set")
+            self._client = Julep(api_key=api_key)
+        return self._client
+
+    def _task_definition(self):
+        """Build the Julep task workflow with the static prompt as system message"""
+        # Static instructions live in the task itself; only the dynamic tail travels per request
+        return [
+            {
+                "prompt": [
+                    {"role": "system", "content": self._static_prompt},
+                    {"role": "user", "content": '$ f"""{steps[0].input.prompt}"""'},
+                ]
+            }
+        ]
+
+    def _load_julep_ids(self):
+        """Read cached agent/task ids, or an empty dict if there are none"""
         try:
-            current_window = get_active_window() or "Unknown Window"
-            
-            # Build context-aware prompt
-            context = "\n".join(
-                f"User: {msg['user']}\nAssistant: {msg['assistant']}" 
-                for msg in self.conversation_history[-3:]  # Keep last 3 exchanges
-            )
+            with open(JULEP_IDS_PATH, 'rb') as f:
+                ids = orjson.loads(f.read())
+        except (OSError, orjson.JSONDecodeError):
+            return {}
+        # Valid JSON that is not an object (e.g. [] or null) counts as no cache
+        return ids if isinstance(ids, dict) else {}
+
+    def _save_julep_ids(self, ids):
+        try:
+            os.makedirs(os.path.dirname(JULEP_IDS_PATH), exist_ok=True)
+            with open(JULEP_IDS_PATH, 'wb') as f:
+                f.write(orjson.dumps(ids))
+        except OSError as e:
+            self.log(f"Could not cache Julep ids: {str(e)}")
+
+    def _ensure_task(self):
+        """Return the Julep task id, reusing the cached one while its definition is unchanged"""
+        if self.task_id:
+            return self.task_id
+        
+        main = self._task_definition()
+        template_hash = hashlib.sha256(
+            orjson.dumps({'agent': AGENT_CONFIG, 'task': main}, option=orjson.OPT_SORT_KEYS)
+        ).hexdigest()
+        
+        cached = self._load_julep_ids()
+        if cached.get('template_hash') == template_hash and cached.get('task_id'):
+            try:
+                self.client.tasks.get(cached['task_id'])
+                self.task_id = cached['task_id']
+                return self.task_id
+            except Exception:
+                pass  # Task was deleted or is unreachable, create a new one
+        
+        # Create the agent
+        try:
+            agent = self.client.agents.create(**AGENT_CONFIG)
+        except Exception as e:
+            self.log(f"Agent creation failed: {str(e)}")
+            raise
             
-            # Format the main template first
-            main_prompt = self.PROMPT_TEMPLATE.format(
-                window_title=current_window,
-                commands=list(self.actions.keys()),
-                text=text
+        # Create the task template
+        try:
+            task = self.client.tasks.create(
+                agent_id=agent.id,
+                name="Voice Command Handler",
+                description="Interpret user voice command and return system-level actions in JSON",
+                main=main
             )
+        except Exception as e:
+            self.log(f"Task creation failed: {str(e)}")
+            raise
+        
+        self.task_id = task.id
+        self._save_julep_ids({
+            'agent_id': agent.id,
+            'task_id': task.id,
+            'template_hash': template_hash
+        })
+        return self.task_id
+
+    def _cache_template(self, key, target, commands):
+        """Store a plan template once the model has produced it twice for the same request shape"""
+        template = generalize_commands(key, target, commands, self.actions)
+        if template is None:
+            return
+        # A single sample is not trusted: the next miss must generalize to the same template
+        if self._template_candidates.pop(key, None) != template:
+            self._template_candidates[key] = template
+            return
+        self._template_cache[key] = template
+        self._template_cache.move_to_end(key)
+        if len(self._template_cache) > TEMPLATE_CACHE_SIZE:
+            self._template_cache.popitem(last=False)
+
+    def _cached_commands(self, key, target):
+        """Fill a cached template with the new target, or None on miss"""
+        template = self._template_cache.get(key)
+        if template is None:
+            return None
+        self._template_cache.move_to_end(key)
+        return fill_template(key, template, target)
+
+    def _prepare_prompt(self, text):
+        """Return (cached commands, prompt, template key, slot value) for a request"""
+        current_window = get_active_window() or "Unknown Window"
+
+        # Reuse a known plan for structurally identical requests
+        template_key, target = match_template(text)
+        if template_key:
+            commands = self._cached_commands(template_key, target)
+            if commands is not None:
+                self.conversation_history.append((text, orjson.dumps(commands).decode()))
+                return commands, None, None, None
+
+        # Build context-aware prompt
+        context = "\n".join(
+            f"User: {user}\nAssistant: {assistant}"
+            for user, assistant in self.conversation_history
+        )
+
+        # Only the per-request tail is sent; the static prompt is part of the task
+        head, before_window, before_text, tail = self._TAIL_PARTS
+        prompt = f"{head}{context}{before_window}{current_window}{before_text}{text}{tail}"
+        return None, prompt, template_key, target
+
+    def _parse_result(self, result, text, template_key, target):
+        """Turn a finished Julep execution into a command list"""
+        if result.status == "succeeded":
+            # Extract the response text - handle different response formats
+            output = getattr(result, 'output', None)
+            raw_text = _EXTRACTORS.get(type(output), _from_other)(output)
+
+            if not raw_text:
+                # Fallback: convert the entire output to string and try to extract
+                output_str = str(output)
+                # Look for a JSON array pattern
+                json_match = _JSON_ARRAY_RE.search(output_str)
+                if json_match:
+                    raw_text = json_match.group(0)
+                else:
+                    self.log("No valid response found in Julep output")
+                    return []
+
+            clean_text = _CODE_FENCE_RE.sub('', raw_text).strip()
+
+            try:
+                commands = orjson.loads(clean_text)
+                # Update conversation history
+                self.conversation_history.append((text, raw_text))
+                if template_key:
+                    self._cache_template(template_key, target, commands)
+                return commands
+            except orjson.JSONDecodeError as e:
+                # Try to extract JSON from the response
+                start_idx = clean_text.find('[')
+                end_idx = clean_text.rfind(']') + 1
+                if start_idx != -1 and end_idx != 0:
+                    json_str = clean_text[start_idx:end_idx]
+                    try:
+                        commands = orjson.loads(json_str)
+                    except orjson.JSONDecodeError:
+                        # Last resort: stdlib json accepts raw control characters inside strings
+                        import json
+                        try:
+                            commands = json.loads(json_str, strict=False)
+                        except json.JSONDecodeError:
+                            commands = None
+                    if commands is not None:
+                        self.conversation_history.append((text, json_str))
+                        if template_key:
+                            self._cache_template(template_key, target, commands)
+                        return commands
+
+                self.log(f"Failed to parse JSON response: {e}\nResponse: {clean_text}")
+                return []
+        else:
+            error_msg = getattr(result, 'error', 'Unknown error')
+            self.log(f"Julep AI failed: {error_msg}")
+            return []
+
+    def _poll_delay(self, attempts):
+        """Exponential backoff between execution status checks"""
+        return min(POLL_INITIAL_DELAY * (POLL_BACKOFF ** attempts), POLL_MAX_DELAY)
+
+    def generate_commands(self, text):
+        """Blocking wrapper around generate_commands_async"""
+        return asyncio.run(self.generate_commands_async(text))
+
+    async def generate_commands_async(self, text):
+        """Turn a voice request into commands, awaiting Julep so callers can work meanwhile"""
+        try:
+            cached, prompt, template_key, target = self._prepare_prompt(text)
+            if cached is not None:
+                return cached
             
-            # Combine with context
-            prompt = f"Previous conversation context:\n{context}\n\n{main_prompt}"
-            
-            execution = self.client.executions.create(
-                task_id=self.task.id,
+            task_id = await asyncio.to_thread(self._ensure_task)
+            execution = await asyncio.to_thread(
+                self.client.executions.create,
+                task_id=task_id,
                 input={"prompt": prompt}
             )
 
-            # Wait for execution to complete
-            max_attempts = 30  # 15 seconds max wait
+            # Wait for execution to complete, polling fast first and backing off
+            deadline = time.monotonic() + POLL_TIMEOUT
             attempts = 0
-            while attempts < max_attempts:
-                result = self.client.executions.get(execution.id)
-                if result.status in ['succeeded', 'failed']:
+            while True:
+                result = await asyncio.to_thread(self.client.executions.get, execution.id)
+                if result.status in ['succeeded', 'failed'] or time.monotonic() >= deadline:
                     break
-                time.sleep(0.5)
+                await asyncio.sleep(self._poll_delay(attempts))
                 attempts += 1
             
-            if result.status == "succeeded":
-                # Extract the response text - handle different response formats
-                raw_text = ""
-                
-                if hasattr(result, 'output'):
-                    # Handle the complex response structure shown in the error
-                    if isinstance(result.output, list):
-                        # Look for assistant message in the list
-                        for item in result.output:
-                            if hasattr(item, 'role') and item.role == 'assistant' and hasattr(item, 'content'):
-                                raw_text = item.content
-                                break
-                            elif isinstance(item, dict) and item.get('role') == 'assistant':
-                                raw_text = item.get('content', '')
-                                break
-                    elif isinstance(result.output, dict):
-                        # Try to extract from different possible structures
-                        if 'choices' in result.output and len(result.output['choices']) > 0:
-                            choice = result.output['choices'][0]
-                            if 'message' in choice and 'content' in choice['message']:
-                                raw_text = choice['message']['content']
-                            elif 'content' in choice:
-                                raw_text = choice['content']
-                        elif 'content' in result.output:
-                            raw_text = result.output['content']
-                
-                if not raw_text:
-                    # Fallback: convert the entire output to string and try to extract
-                    output_str = str(result.output)
-                    # Look for a JSON array pattern
-                    json_match = re.search(r'\[\s*\{.*\}\s*\]', output_str, re.DOTALL)
-                    if json_match:
-                        raw_text = json_match.group(0)
-                    else:
-                        if self.assistant:
-                            self.assistant.log("No valid response found in Julep output")
-                        return []
-                
-                clean_text = raw_text.replace('```json', '').replace('```', '').strip()
-                
-                try:
-                    commands = json.loads(clean_text)
-                    # Update conversation history
-                    self.conversation_history.append({
-                        'user': text,
-                        'assistant': raw_text,
-                        'window': current_window,
-                        'timestamp': time.time()
-                    })
-                    return commands
-                except json.JSONDecodeError as e:
-                    # Try to extract JSON from the response
-                    start_idx = clean_text.find('[')
-                    end_idx = clean_text.rfind(']') + 1
-                    if start_idx != -1 and end_idx != 0:
-                        try:
-                            json_str = clean_text[start_idx:end_idx]
-                            commands = json.loads(json_str)
-                            self.conversation_history.append({
-                                'user': text,
-                                'assistant': json_str,
-                                'window': current_window,
-                                'timestamp': time.time()
-                            })
-                            return commands
-                        except json.JSONDecodeError:
-                            pass
-                    
-                    if self.assistant:
-                        self.assistant.log(f"Failed to parse JSON response: {e}\nResponse: {clean_text}")
-                    return []
-            else:
-                if self.assistant:
-                    error_msg = getattr(result, 'error', 'Unknown error')
-                    self.assistant.log(f"Julep AI failed: {error_msg}")
-                return []
+            return self._parse_result(result, text, template_key, target)
                 
         except Exception as e:
-            if self.assistant:
-                self.assistant.log(f"Command processing failed: {e}")
+            self.log(f"Command processing failed: {e}")
             return []
 
     def execute_commands(self, commands):
@@ -441,19 +715,19 @@ class CommandHandler:
         if not commands or not isinstance(commands, list):
             return
             
+        actions = self.actions
         for cmd in commands:
+            if not isinstance(cmd, dict):
+                self.log(f"Skipping malformed command: {cmd}")
+                continue
+            handler = actions.get(cmd.get("command"))
+            if handler is None:
+                self.log(f"Unknown command: {cmd.get('command')}")
+                continue
             try:
-                command_name = cmd.get("command")
-                parameters = cmd.get("parameters", {})
-                
-                if command_name in self.actions:
-                    self.actions[command_name](**parameters)
-                else:
-                    if self.assistant:
-                        self.assistant.log(f"Unknown command: {command_name}")
+                handler(**(cmd.get("parameters") or {}))
             except Exception as e:
-                if self.assistant:
-                    self.assistant.log(f"Error executing command {cmd}: {str(e)}")
+                self.log(f"Error executing command {cmd}: {str(e)}")
 
     # Command implementations
     def left_click(self, **kwargs):
@@ -470,9 +744,8 @@ class CommandHandler:
         move_x = kwargs.get('move_x', move_x)
         move_y = kwargs.get('move_y', move_y)
         
-        screen_width, screen_height = pyautogui.size()
-        x = int(float(move_x) * screen_width)
-        y = int(float(move_y) * screen_height)
+        x = int(float(move_x) * self._screen_w)
+        y = int(float(move_y) * self._screen_h)
         pyautogui.moveTo(x, y, duration=0.5)
 
     def press_keys(self, keys=[], **kwargs):
@@ -484,12 +757,44 @@ class CommandHandler:
             elif keys:
                 kb.press_and_release(keys[0])
         except Exception as e:
-            if self.assistant:
-                self.assistant.log(f"Key press failed: {e}")
+            self.log(f"Key press failed: {e}")
+
+    def _direct_executable(self, command):
+        """Resolved .exe path if command can be started without a shell, else None"""
+        if command.startswith(('cmd ', 'start ')) or SHELL_METACHARS.intersection(command):
+            return None
+        try:
+            tokens = shlex.split(command, posix=False)
+        except ValueError:
+            return None  # e.g. unbalanced quotes, leave it to cmd
+        if not tokens:
+            return None
+        # posix=False keeps quotes on the tokens; the command string itself is passed on unchanged
+        path = shutil.which(tokens[0].strip('"'))
+        # which() also resolves .cmd/.bat through PATHEXT, which CreateProcess cannot run
+        if path and path.lower().endswith('.exe'):
+            return path
+        return None
 
     def run_system_command(self, command="", **kwargs):
         command = kwargs.get('command', command)
         try:
+            # Launch plain executables directly, without a cmd.exe in between
+            executable = self._direct_executable(command)
+            if executable:
+                try:
+                    subprocess.Popen(
+                        command,
+                        executable=executable,
+                        shell=False,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL,
+                        creationflags=subprocess.CREATE_NO_WINDOW | subprocess.DETACHED_PROCESS
+                    )
+                    return True
+                except OSError:
+                    pass  # Fall back to cmd below
+
             # Add cmd /c prefix if not already present
             if not command.startswith(('cmd ', 'start ', 'explorer ')):
                 command = f'cmd /c "{command}"'
@@ -497,35 +802,31 @@ class CommandHandler:
             subprocess.Popen(
                 command,
                 shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
                 creationflags=subprocess.CREATE_NO_WINDOW
             )
             return True
         except Exception as e:
-            if self.assistant:
-                self.assistant.log(f"Command execution error: {str(e)}")
+            self.log(f"Command execution error: {str(e)}")
             return False
 
     def type_text(self, text="", **kwargs):
         """Type text with optional delay between keystrokes"""
         text = kwargs.get('text', text)
-        delay = kwargs.get('delay', 0.05)
+        delay = kwargs.get('delay', 0)
         
         if not text:
             return
 
-        if self.assistant:
-            self.assistant.log(text)  # log the text
+        self.log(text)  # log the text
         
-        for char in text:
-            kb.write(char)
-            time.sleep(delay)
+        # keyboard.write handles the per-character delay itself when one is requested
+        kb.write(text, delay=float(delay))
 
     def pause_command(self, **kwargs):
         if self.assistant:
             self.assistant.activated = False
-            if hasattr(self.assistant, 'log'):
-                self.assistant.log("🛑 Deactivated. Say 'arise' to wake me.")
+            self.log("🛑 Deactivated. Say 'arise' to wake me.")
             if hasattr(self.assistant, 'gui') and self.assistant.gui:
                 self.assistant.gui.update_status("waiting")
\ No newline at end of file
@@ -0,0 +1,90 @@
+import re
+from urllib.parse import quote_plus
+
+# Template cache helpers for "<verb> <target>" requests whose plans only differ by target.
+# Only search queries and URLs are templated: they reach the command verbatim,
+# while app names get rewritten by the model (edge -> msedge).
+SLOT = "<slot>"
+_SLOT_RE = re.compile(re.escape(SLOT))
+_FILLER_RE = re.compile(r"^(?:(?:please|hey|ok|okay|can you|could you|would you|kindly|just)\s+)+|\s+(?:please|for me|now)$", re.IGNORECASE)
+_TEMPLATE_RE = re.compile(r"^(search for|search|google|look up|go to|visit|navigate to|open)\s+(?:the\s+)?(.+)$", re.IGNORECASE)
+_SEARCH_VERBS = frozenset({'search for', 'search', 'google', 'look up'})
+_URL_RE = re.compile(r"^(?:https?://)?[\w-]+(?:\.[\w-]+)+(?:/\S*)?$")
+_SCHEME_RE = re.compile(r"^https?://", re.IGNORECASE)
+_MULTI_STEP_RE = re.compile(r"\b(?:and|then|after|before)\b|,", re.IGNORECASE)
+
+
+def _replace_slot(value, pattern, new):
+    """Recursively substitute pattern with new(string) in every string value of a command structure"""
+    if isinstance(value, str):
+        return pattern.sub(lambda match: new(value), value)
+    if isinstance(value, list):
+        return [_replace_slot(item, pattern, new) for item in value]
+    if isinstance(value, dict):
+        return {key: _replace_slot(item, pattern, new) for key, item in value.items()}
+    return value
+
+
+def _token_pattern(*targets):
+    """Match any of targets as a whole token, case-insensitively"""
+    alternatives = "|".join(re.escape(target) for target in targets)
+    return re.compile(r"(?<!\w)(?:" + alternatives + r")(?!\w)", re.IGNORECASE)
+
+
+def _is_url(value):
+    return "://" in value or value.startswith("www.")
+
+
+def match_template(text):
+    """Return (request template, slot value) for a templatable request, else (None, None)"""
+    normalized = " ".join(text.strip().rstrip(".!?").split())
+    normalized = _FILLER_RE.sub("", normalized)
+    match = _TEMPLATE_RE.match(normalized)
+    if not match:
+        return None, None
+    verb, target = match.groups()
+    verb = verb.lower()
+    if _MULTI_STEP_RE.search(target) or len(target.split()) > 4:
+        return None, None
+    if verb in _SEARCH_VERBS:
+        return f"{verb} <q>", target
+    if _URL_RE.match(target):
+        return f"{verb} <url>", target
+    return None, None
+
+
+def generalize_commands(key, target, commands, known_commands):
+    """Turn a single-command plan into a template, or None if it is not reusable"""
+    if not isinstance(commands, list) or len(commands) != 1:
+        return None
+    cmd = commands[0]
+    if not isinstance(cmd, dict) or cmd.get("command") not in known_commands:
+        return None
+    parameters = cmd.get("parameters") or {}
+    if not isinstance(parameters, dict):
+        return None
+
+    if key.endswith("<url>"):
+        # The whole URL parameter becomes the slot, so any spoken URL can be filled in
+        pattern = _token_pattern(_SCHEME_RE.sub("", target))
+        generalized = {
+            name: SLOT if isinstance(value, str) and pattern.search(value) else value
+            for name, value in parameters.items()
+        }
+    else:
+        # Queries show up either verbatim (type_text) or URL-encoded (search URLs)
+        pattern = _token_pattern(target, quote_plus(target))
+        generalized = _replace_slot(parameters, pattern, lambda _: SLOT)
+
+    if generalized == parameters:
+        return None
+    return {"command": cmd["command"], "parameters": generalized}
+
+
+def fill_template(key, template, target):
+    """Fill a template produced by generalize_commands with a new target"""
+    if key.endswith("<url>"):
+        url = target if _SCHEME_RE.match(target) else f"https://{target}"
+        return [_replace_slot(template, _SLOT_RE, lambda _: url)]
+    # Encode the query inside URLs, keep it as spoken everywhere else
+    return [_replace_slot(template, _SLOT_RE, lambda value: quote_plus(target) if _is_url(value) else target)]
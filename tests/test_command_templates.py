@@ -0,0 +1,56 @@
+import unittest
+
+from command_templates import SLOT, fill_template, generalize_commands, match_template
+
+KNOWN = {'open_url', 'run_command', 'type_text'}
+
+
+def plan(name, **parameters):
+    return [{"command": name, "parameters": parameters}]
+
+
+class MatchTemplateTest(unittest.TestCase):
+    def test_url_and_search_requests(self):
+        self.assertEqual(match_template("Please go to YouTube.com."), ("go to <url>", "YouTube.com"))
+        self.assertEqual(match_template("search for new york"), ("search for <q>", "new york"))
+
+    def test_app_names_and_multi_step_requests_are_not_templated(self):
+        self.assertEqual(match_template("open notepad"), (None, None))
+        self.assertEqual(match_template("open edge"), (None, None))
+        self.assertEqual(match_template("go to youtube.com and play music"), (None, None))
+
+
+class GeneralizeCommandsTest(unittest.TestCase):
+    def test_url_parameter_becomes_the_whole_slot(self):
+        template = generalize_commands("go to <url>", "youtube.com",
+                                       plan("open_url", url="https://www.youtube.com"), KNOWN)
+        self.assertEqual(template, {"command": "open_url", "parameters": {"url": SLOT}})
+        self.assertEqual(fill_template("go to <url>", template, "https://github.com/foo"),
+                         plan("open_url", url="https://github.com/foo"))
+        self.assertEqual(fill_template("go to <url>", template, "github.com"),
+                         plan("open_url", url="https://github.com"))
+
+    def test_search_slot_is_url_encoded_inside_urls(self):
+        template = generalize_commands("search for <q>", "new york",
+                                       plan("open_url", url="https://google.com/search?q=new+york"), KNOWN)
+        self.assertEqual(fill_template("search for <q>", template, "tom & jerry"),
+                         plan("open_url", url="https://google.com/search?q=tom+%26+jerry"))
+
+    def test_search_slot_is_verbatim_outside_urls(self):
+        template = generalize_commands("search <q>", "cats", plan("type_text", text="cats"), KNOWN)
+        self.assertEqual(fill_template("search <q>", template, "tom & jerry"),
+                         plan("type_text", text="tom & jerry"))
+
+    def test_target_only_matches_whole_tokens(self):
+        self.assertIsNone(generalize_commands("search <q>", "edge",
+                                              plan("run_command", command="start msedge"), KNOWN))
+
+    def test_only_single_known_commands_are_generalized(self):
+        two = plan("open_url", url="https://a.com") + plan("type_text", text="a.com")
+        self.assertIsNone(generalize_commands("go to <url>", "a.com", two, KNOWN))
+        self.assertIsNone(generalize_commands("go to <url>", "a.com", plan("hotkey", url="a.com"), KNOWN))
+        self.assertIsNone(generalize_commands("go to <url>", "a.com", plan("open_url", url="b.com"), KNOWN))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,10 @@
 # voice_assistant.py
 import time
 import os
+import asyncio
 import speech_recognition as sr
 from speech_processor import SpeechProcessor
-from command_handler import CommandHandler
+from command_handler import CommandHandler, BACKGROUND_COMMANDS
 from config import Config
 from window_utils import get_active_window
 import threading
@@ -113,7 +114,7 @@ class VoiceAssistant:
         try:
             if self.gui:
                 self.gui.start_loading(transcript)  # Pass transcript here
-            commands = self.command_handler.generate_commands(transcript)
+            commands = asyncio.run(self.generate_with_prelude(transcript))
             self.execute_commands(commands)
         finally:
             self.is_processing = False
@@ -121,41 +122,67 @@ class VoiceAssistant:
             if self.gui:
                 self.gui.stop_loading()
 
+    async def generate_with_prelude(self, transcript):
+        """Generate commands, telling the user when the LLM takes a while"""
+        generation = asyncio.ensure_future(
+            self.command_handler.generate_commands_async(transcript)
+        )
+        done, _ = await asyncio.wait({generation}, timeout=1.0)
+        if not done:
+            self.log("⏳ Still working on it...")
+        return await generation
+
     def execute_commands(self, commands):
-        """Execute commands with enhanced synchronization"""
+        """Execute commands with enhanced synchronization
+
+        Consecutive background commands are launched in order, back to back,
+        and the window/page stabilization waits run once for the whole batch.
+        """
         self.log("⚡ Executing commands...")
         index = 0
         #last_window_state = set(get_all_open_windows())
         
         while index < len(commands) and VoiceAssistant.is_active:
-            cmd = commands[index]
-            command_name = cmd.get("command")
-            params = cmd.get("parameters", {})
+            # Group consecutive background commands into one batch
+            end = index + 1
+            if commands[index].get("command") in BACKGROUND_COMMANDS:
+                while end < len(commands) and commands[end].get("command") in BACKGROUND_COMMANDS:
+                    end += 1
+            batch = commands[index:end]
             
             try:
                 pre_windows = set(get_all_open_windows())
+                executed = []
+                start_time = time.time()
                 
-                self.log(f"Executing: {command_name} {params}")
-                handler = self.command_handler.actions.get(command_name)
+                for cmd in batch:
+                    command_name = cmd.get("command")
+                    params = cmd.get("parameters", {})
+                    self.log(f"Executing: {command_name} {params}")
+                    handler = self.command_handler.actions.get(command_name)
+                    if handler:
+                        try:
+                            handler(**params)
+                            executed.append(command_name)
+                        except Exception as e:
+                            self.log(f"Execution error: {e}")
+                exec_time = time.time() - start_time
                 
-                if handler:
-                    start_time = time.time()
-                    handler(**params)
-                    exec_time = time.time() - start_time
-                    
+                if executed:
                     # Enhanced synchronization logic
-                    if command_name == "run_command":
+                    launches = executed.count("run_command")
+                    if launches:
                         # Extended window detection timeout
                         launch_timeout = 7  # Increased from 3 seconds
                         window_found = False
                         
-                        # Detect window creation
+                        # Detect window creation, one new window per launched command
                         window_start = time.time()
                         while (time.time() - window_start) < launch_timeout:
                             current_windows = set(get_all_open_windows())
                             new_windows = current_windows - pre_windows
                             
-                            if new_windows:
+                            if len(new_windows) >= launches:
                                 window_found = True
                                 break
                             time.sleep(0.1)
@@ -165,26 +192,26 @@ class VoiceAssistant:
                             time.sleep(0.5)  # Added post-window detection wait
                             
                             # Skip subsequent long waits
-                            if (index + 1 < len(commands)):
-                                next_cmd = commands[index+1]
+                            if end < len(commands):
+                                next_cmd = commands[end]
                                 if (next_cmd.get("command") == "sleep" and 
                                     next_cmd.get("parameters", {}).get("duration", 0) > 0.5):
-                                    index += 1
+                                    end += 1
 
                     # General inter-command synchronization
-                    if command_name != "sleep":
+                    if executed != ["sleep"]:
                         # Extended minimum delay between commands
                         remaining_delay = max(0, 0.3 - exec_time)  # Increased from 0.15
                         time.sleep(remaining_delay)
 
                     # Special handling for browser navigation
-                    if command_name == "open_url":
+                    if "open_url" in executed:
                         time.sleep(1.5)  # Additional stabilization for web pages
 
-                index += 1
+                index = end
                 
             except Exception as e:
                 self.log(f"Execution error: {e}")
-                index += 1
+                index = end
                 
         self.log("🗝️ All commands executed")
\ No newline at end of file